@@ -1,2 +1,2 @@
-pip install streamlit
+pip install streamlit numpy
 streamlit run app.py
@@ -1,35 +1,44 @@
 # app.py
 # DC-5 Box Generator + Best Straight Picker
 from __future__ import annotations
-import json, io
-from itertools import combinations_with_replacement, permutations
+import json, re, functools
+from itertools import combinations_with_replacement
 from collections import Counter
+import numpy as np
 import streamlit as st
 
+try:
+    import orjson                      # optional: faster JSON parsing of positional stats
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 st.set_page_config(page_title="DC-5: Constrained Boxes → Best Straight(s)", layout="wide")
 st.title("DC-5: Constrained Boxes → Best Straight(s)")
 
 LOW_MAX_DEFAULT = 4
-EPS = 1e-15
 
 # -------------------- Parsers & helpers --------------------
-def parse_mandatory_digits(s: str) -> list[int]:
+# Both digit parsers are memoized on the raw string (immutable results, safe to share across reruns)
+@functools.lru_cache(maxsize=32)
+def parse_mandatory_digits(s: str) -> tuple[int, ...]:
     out, seen = [], set()
     for t in (s or "").replace(",", " ").split():
         if t.isdigit():
             d = int(t)
             if 0 <= d <= 9 and d not in seen:
                 out.append(d); seen.add(d)
-    return out
+    return tuple(out)
 
-def parse_forbidden_digits(s: str) -> set[int]:
+@functools.lru_cache(maxsize=32)
+def parse_forbidden_digits(s: str) -> frozenset[int]:
     out = set()
     for t in (s or "").replace(",", " ").split():
         if t.isdigit():
             d = int(t)
             if 0 <= d <= 9:
                 out.add(d)
-    return out
+    return frozenset(out)
 
 def longest_consecutive_run_length(uniq_sorted: list[int]) -> int:
     if not uniq_sorted: return 0
@@ -41,6 +50,19 @@ def longest_consecutive_run_length(uniq_sorted: list[int]) -> int:
             run = 1
     return best
 
+def unique_perms(box):
+    """Distinct permutations of `box`, each exactly once, in lexicographic order (next-permutation)."""
+    a = sorted(box); n = len(a)
+    while True:
+        yield tuple(a)
+        i = n - 2
+        while i >= 0 and a[i] >= a[i+1]: i -= 1
+        if i < 0: return
+        j = n - 1
+        while a[j] <= a[i]: j -= 1
+        a[i], a[j] = a[j], a[i]
+        a[i+1:] = a[:i:-1]
+
 def violates_patterns(counts: Counter, allow_quints, allow_quads, allow_triples, allow_double_doubles):
     vals = list(counts.values())
     if not allow_quints and any(v == 5 for v in vals): return True
@@ -57,6 +79,11 @@ def normalize_row(row):
     if s > 0:                return [x/s for x in row]
     return row
 
+# Shorthand grammar: segments are separated by ";" or newlines, chunks within a segment by ","
+_SH_SEG = re.compile(r"(?:^|[;\n])\s*p([1-5])[^\S\n]*:([^;\n]*)", re.IGNORECASE)
+_SH_KV  = re.compile(r"(?:^|,)\s*(\d+)\s*(?::([^,]*)|\s+([^\s,:]+)\s*(?=,|$))")
+
+@st.cache_data(show_spinner=False, max_entries=8)     # keyed on pasted text; keep only recent edits
 def parse_positional_stats(text: str) -> dict[int, list[float]]:
     """
     Accept JSON or shorthand:
@@ -70,7 +97,7 @@ def parse_positional_stats(text: str) -> dict[int, list[float]]:
         return {}
     # Try JSON first
     try:
-        obj = json.loads(text)
+        obj = _json_loads(text)
         out = {}
         for k in ("p1","p2","p3","p4","p5"):
             if k not in obj:
@@ -81,43 +108,139 @@ def parse_positional_stats(text: str) -> dict[int, list[float]]:
     except json.JSONDecodeError:
         pass
 
-    # Shorthand: tolerate newlines by converting to semicolons
+    # Shorthand: one scan for "pN: ..." segments (split on ";" or newlines), one per "d:v" / "d v" chunk
     out = {}
-    segments = [seg.strip() for seg in text.replace("\n",";").split(";") if seg.strip()]
-    for seg in segments:
-        if ":" not in seg: continue
-        head, tail = seg.split(":", 1)
-        head = head.strip().lower()
-        if not (len(head) == 2 and head[0] == "p" and head[1] in "12345"): continue
-        pos = int(head[1]); row = [0.0]*10
-        for chunk in tail.split(","):
-            chunk = chunk.strip()
-            if not chunk: continue
-            if ":" in chunk:
-                d_str, v_str = [x.strip() for x in chunk.split(":", 1)]
-            else:
-                parts = chunk.split()
-                if len(parts) != 2: continue
-                d_str, v_str = parts
-            if d_str.isdigit():
-                d = int(d_str)
-                if 0 <= d <= 9:
-                    try: v = float(v_str.replace("%",""))
-                    except: v = 0.0
-                    row[d] = v
+    for seg in _SH_SEG.finditer(text):
+        pos = int(seg.group(1)); row = [0.0]*10
+        for d_str, v_colon, v_space in _SH_KV.findall(seg.group(2)):
+            d = int(d_str)
+            if 0 <= d <= 9:
+                try: v = float((v_colon or v_space).replace("%",""))
+                except: v = 0.0
+                row[d] = v
         out[pos] = normalize_row(row)
     if len(out) != 5:
         raise ValueError("Provide p1..p5 positional rows.")
     return out
 
-def prod_score(straight, pos_probs: dict[int, list[float]]) -> float:
-    s = 1.0
-    for i, d in enumerate(straight, start=1):
-        s *= pos_probs.get(i, [0.0]*10)[d]
-    return s
+# -------------------- Box universe (precomputed features) --------------------
+POW10 = np.array([10000, 1000, 100, 10, 1])        # digits -> int code; code order == lex order
 
-def add_score(straight, pos_probs: dict[int, list[float]]) -> float:
-    return sum(pos_probs.get(i, [0.0]*10)[d] for i, d in enumerate(straight, start=1))
+@st.cache_resource(show_spinner=False)
+def _box_universe():
+    """
+    All C(14,5)=2002 boxes, one row each, plus per-box features.
+    Rows are ordered by digit sum (then combinations order), so any sum range is the
+    contiguous slice SUM_PTR[sum_min]:SUM_PTR[sum_max+1] and the other filters only
+    ever look at that slice.
+    Built once per process (not per rerun); filters become masks over these read-only arrays.
+    """
+    boxes = np.array(list(combinations_with_replacement(range(10), 5)), dtype=np.int8)
+    sums  = boxes.sum(1)
+    order = np.argsort(sums, kind="stable")
+    boxes, sums = boxes[order], sums[order]
+    n     = len(boxes)
+    hist  = np.zeros((n, 10), np.int8)                 # hist[i, d] = count of digit d in box i
+    np.add.at(hist, (np.arange(n)[:, None], boxes), 1)
+    # Longest run of consecutive distinct digits: sweep digits 0..9 once over all boxes
+    run = runs = np.zeros(n, np.int8)
+    for d in range(10):
+        run  = np.where(hist[:, d] > 0, run + 1, 0).astype(np.int8)
+        runs = np.maximum(runs, run)
+    arrays = (
+        boxes,
+        boxes @ POW10,                                 # BOX_CODES
+        np.searchsorted(sums, np.arange(47)),          # SUM_PTR[s] = first row with sum >= s
+        ((hist > 0) @ (1 << np.arange(10))).astype(np.uint16),   # PRESENT: bit d set if digit d in box
+        (hist == 5).any(1),                            # HAS5   (quint)
+        (hist == 4).any(1),                            # HAS4   (quad)
+        (hist == 3).any(1),                            # HAS3   (triple)
+        (hist == 2).sum(1) >= 2,                       # DD     (double double)
+        hist[:, ::2].sum(1, dtype=np.int8),            # EVENS
+        # LOWS_BY_LMAX[low_max, box] = digits <= low_max: the cumulative histogram, one row per low_max
+        np.ascontiguousarray(hist.cumsum(1, dtype=np.int8).T),
+        runs >= 4,                                     # HAS_RUN4 (run of 4+ consecutive digits)
+    )
+    # Distinct permutations of every box, CSR-style: box i owns rows perm_ptr[i]:perm_ptr[i+1]
+    per_box  = [list(unique_perms(b)) for b in boxes.tolist()]
+    perm_ptr = np.concatenate(([0], np.cumsum([len(p) for p in per_box])))
+    perms    = np.array([p for ps in per_box for p in ps], dtype=np.int8)
+    arrays += (perms, perms @ POW10, perm_ptr)   # PERMS, PERM_CODES, PERM_PTR
+    for a in arrays:
+        a.flags.writeable = False
+    return arrays
+
+(ALL_BOXES, BOX_CODES, SUM_PTR, PRESENT, HAS5, HAS4, HAS3, DD, EVENS, LOWS_BY_LMAX, HAS_RUN4,
+ PERMS, PERM_CODES, PERM_PTR) = _box_universe()
+N_BOXES = len(ALL_BOXES)
+
+@st.cache_resource(show_spinner=False)
+def _code_strings() -> tuple[str, ...]:
+    """STR5[code] = the 5-digit string for int code 0..99999 (every box/straight is one of these)."""
+    return tuple(f"{i:05d}" for i in range(100000))
+
+STR5 = _code_strings()
+
+# -------------------- Generation (cached per constraint set) --------------------
+@st.cache_data(show_spinner=False, max_entries=64)    # process-wide; bounded LRU across sessions
+def generate(sum_min, sum_max, low_max, min_low, max_low, min_high, max_high,
+             min_even, max_even, min_odd, max_odd, mand_bits, forbid_bits,
+             allow_quints, allow_quads, allow_triples, allow_dd, allow_runs4p,
+             pos_probs: dict[int, list[float]]):
+    """
+    Filter the box universe and, with positional stats, pick each kept box's best straight(s).
+    Returns (kept box count, kept box codes in combinations order, straights or None).
+    """
+    # Filter boxes: one vectorized mask over the precomputed universe
+    # The sum range prunes to a contiguous slice; every other filter runs on that slice only
+    sl    = slice(SUM_PTR[sum_min], SUM_PTR[sum_max + 1])
+    lows  = LOWS_BY_LMAX[low_max, sl]; highs = 5 - lows
+    evens = EVENS[sl];                 odds  = 5 - evens
+    m  = (lows  >= min_low)  & (lows  <= max_low)
+    m &= (highs >= min_high) & (highs <= max_high)
+    m &= (evens >= min_even) & (evens <= max_even)
+    m &= (odds  >= min_odd)  & (odds  <= max_odd)
+    if forbid_bits: m &= (PRESENT[sl] & forbid_bits) == 0
+    if mand_bits:   m &= (PRESENT[sl] & mand_bits)   != 0
+    if not allow_quints:  m &= ~HAS5[sl]
+    if not allow_quads:   m &= ~HAS4[sl]
+    if not allow_triples: m &= ~HAS3[sl]
+    if not allow_dd:      m &= ~DD[sl]
+    if not allow_runs4p:  m &= ~HAS_RUN4[sl]
+    kept_idx   = np.flatnonzero(m) + sl.start
+    kept_codes = BOX_CODES[kept_idx]
+    order      = np.argsort(kept_codes)                           # back to combinations order
+    kept_idx, kept_codes = kept_idx[order], kept_codes[order]
+
+    # With positional stats → pick each box's best straight
+    final_list = None
+    if pos_probs:
+        # Positional probabilities as a (5,10) matrix: P[i, d] = prob of digit d at position i+1
+        P   = np.array([pos_probs[i] for i in range(1, 6)], dtype=np.float64)
+        pos = np.arange(5)
+
+        # Score the distinct permutations of all kept boxes in one pass. Kept box k owns
+        # rows row_ptr[k]:row_ptr[k+1] of the gathered block (CSR offsets).
+        starts, lens = PERM_PTR[kept_idx], PERM_PTR[kept_idx + 1] - PERM_PTR[kept_idx]
+        row_ptr = np.concatenate(([0], np.cumsum(lens)))
+        rows    = np.repeat(starts - row_ptr[:-1], lens) + np.arange(row_ptr[-1])
+        perms, codes = PERMS[rows], PERM_CODES[rows]
+        g       = P[pos, perms]
+        # Left-to-right product/sum, the same float operations as scoring one perm at a time,
+        # so exact ties (and the lexicographic tie-break) match a per-perm loop bit for bit
+        pscore  = g[:, 0] * g[:, 1] * g[:, 2] * g[:, 3] * g[:, 4]
+        ascore  = g[:, 0] + g[:, 1] + g[:, 2] + g[:, 3] + g[:, 4]
+        # Best key per box is (product_score, additive_score, perm_str). Sorting by box, then
+        # that key, leaves each box's rows contiguous; rows are lexicographic within a box and
+        # lexsort is stable, so the last row of each run is that box's best.
+        order     = np.lexsort((ascore, pscore, np.repeat(np.arange(len(kept_idx)), lens)))
+        best_rows = order[row_ptr[1:] - 1]
+
+        # One straight per box. Sort by product score desc, then additive score desc, then lex asc (code order)
+        order      = np.lexsort((codes[best_rows], -ascore[best_rows], -pscore[best_rows]))
+        final_list = [STR5[c] for c in codes[best_rows[order]].tolist()]
+
+    return len(kept_idx), kept_codes, final_list
 
 # -------------------- Sidebar: constraints --------------------
 st.sidebar.header("Constraints")
@@ -128,10 +251,12 @@ low_max = st.sidebar.number_input("Low max digit (low ≤ this value)", 0, 9, LO
 mand_str = st.sidebar.text_input("Mandatory digits (OR logic: at least one must appear)",
                                  help="Comma/space-separated digits, e.g. 7, 0, 2")
 mand_digits = parse_mandatory_digits(mand_str)
+mand_bits   = sum(1 << d for d in mand_digits)      # 10-bit digit-set masks (bit d = digit d)
 
 forbid_str = st.sidebar.text_input("Do NOT use these digits (optional)",
                                    help="Comma/space-separated digits (e.g. 8, 9). Any box containing them will not be generated.")
 forbid_digits = parse_forbidden_digits(forbid_str)
+forbid_bits   = sum(1 << d for d in forbid_digits)
 
 st.sidebar.markdown("**H/L/E/O minimums & maximums (defaults: min=2, max=5)**")
 c1, c2 = st.sidebar.columns(2)
@@ -173,21 +298,23 @@ with st.expander("🔍 Debug a specific combo (why excluded?)"):
             st.error("Please enter exactly 5 digits.")
         else:
             comb = tuple(sorted(int(c) for c in test_combo_str))
-            s = sum(comb); counts = Counter(comb)
+            counts = Counter(comb)
+            s = evens = lows = 0                 # one pass: sum, even count, low count
+            for d in comb:
+                s += d; evens += 1 - (d & 1); lows += d <= low_max
+            odds = 5 - evens; highs = 5 - lows
             msgs, ok = [], True
-            if forbid_digits and any(d in forbid_digits for d in comb):
+            comb_bits = sum(1 << d for d in set(comb))
+            if forbid_bits & comb_bits:
                 ok = False; msgs.append("❌ Forbidden digits present.")
             if not (sum_min <= s <= sum_max):
                 ok = False; msgs.append(f"❌ Sum {s} outside [{sum_min}, {sum_max}].")
-            evens = sum(1 for d in comb if d % 2 == 0); odds = 5 - evens
-            lows  = sum(1 for d in comb if d <= low_max); highs = 5 - lows
             if not (min_low  <= lows  <= max_low):  ok=False; msgs.append(f"❌ Lows={lows} not in [{min_low},{max_low}] (low≤{low_max}).")
             if not (min_high <= highs <= max_high): ok=False; msgs.append(f"❌ Highs={highs} not in [{min_high},{max_high}].")
             if not (min_even <= evens <= max_even): ok=False; msgs.append(f"❌ Evens={evens} not in [{min_even},{max_even}].")
             if not (min_odd  <= odds  <= max_odd):  ok=False; msgs.append(f"❌ Odds={odds} not in [{min_odd},{max_odd}].")
-            mand_digits = parse_mandatory_digits(mand_str)
-            if mand_digits and not any(d in counts for d in mand_digits):
-                ok=False; msgs.append(f"❌ Mandatory digits {mand_digits} not present (OR logic).")
+            if mand_bits and not (mand_bits & comb_bits):
+                ok=False; msgs.append(f"❌ Mandatory digits {list(mand_digits)} not present (OR logic).")
             if violates_patterns(counts, allow_quints, allow_quads, allow_triples, allow_dd):
                 ok=False; msgs.append("❌ Pattern filtered.")
             if not allow_runs4p:
@@ -198,7 +325,13 @@ with st.expander("🔍 Debug a specific combo (why excluded?)"):
             else:  st.error(f"{test_combo_str} was excluded for:"); st.write("\n".join(msgs))
 
 # -------------------- Core generation --------------------
+# generate() is memoized on its arguments, so reruns that leave the inputs unchanged (e.g. using
+# the debug tester) redisplay results without recomputing; once Generate has been clicked,
+# changed inputs regenerate automatically.
 if go:
+    st.session_state["generated"] = True
+
+if st.session_state.get("generated"):
     # Parse positional stats
     pos_probs = {}
     if pos_stats_text.strip():
@@ -211,100 +344,34 @@ if go:
             st.warning(f"Couldn't parse positional stats — proceeding without scoring straights.\nDetails: {e}")
             pos_probs = {}
 
-    # Enumerate boxes
-    total = 0
-    kept_boxes = []
-    for comb in combinations_with_replacement(range(10), 5):
-        total += 1
-        if forbid_digits and any(d in forbid_digits for d in comb): continue
-        s = sum(comb)
-        if not (sum_min <= s <= sum_max): continue
-        counts = Counter(comb)
-        evens = sum(1 for d in comb if d % 2 == 0); odds = 5 - evens
-        lows  = sum(1 for d in comb if d <= low_max); highs = 5 - lows
-        if not (min_low  <= lows  <= max_low):  continue
-        if not (min_high <= highs <= max_high): continue
-        if not (min_even <= evens <= max_even): continue
-        if not (min_odd  <= odds  <= max_odd):  continue
-        mand_digits = parse_mandatory_digits(mand_str)
-        if mand_digits and not any(d in counts for d in mand_digits): continue
-        if violates_patterns(counts, allow_quints, allow_quads, allow_triples, allow_dd): continue
-        if not allow_runs4p:
-            uniq_sorted = sorted(set(comb))
-            if longest_consecutive_run_length(uniq_sorted) >= 4: continue
-        kept_boxes.append(comb)
-
-    st.success(f"Found {len(kept_boxes)} box combos (out of {total} total).")
-
-    # With positional stats → pick best straight(s)
-    if pos_probs:
-        outputs = []
-        notes = []
-
-        for box in kept_boxes:
-            best_key = (-1.0, -1.0, "")  # (product_score, additive_score, perm_str)
-            best_perms = []
-
-            for perm in set(permutations(box)):
-                pscore = prod_score(perm, pos_probs)
-                ascore = add_score(perm, pos_probs)
-                sstr   = "".join(map(str, perm))
-                key    = (pscore, ascore, sstr)
-                if key > best_key:
-                    best_key = key
-                    best_perms = [perm]
-                elif key == best_key:
-                    best_perms.append(perm)
-
-            # Tie logic: keep both only when exactly one position has a 2-way tie
-            pos_vals = [set() for _ in range(5)]
-            for perm in best_perms:
-                for i, d in enumerate(perm):
-                    pos_vals[i].add(d)
-            multi_positions = [i for i, s in enumerate(pos_vals) if len(s) > 1]
-
-            if len(multi_positions) == 1 and len(pos_vals[multi_positions[0]]) == 2:
-                idx = multi_positions[0]
-                variants = {}
-                for perm in best_perms:
-                    k = perm[idx]
-                    if k not in variants:
-                        variants[k] = perm
-                    if len(variants) == 2:
-                        break
-                for perm in variants.values():
-                    outputs.append(("".join(map(str, perm)), best_key[0], best_key[1]))
-            else:
-                best_one = min(("".join(map(str, p)) for p in best_perms))
-                outputs.append((best_one, best_key[0], best_key[1]))
-
-        # Sort by product score desc, then additive score desc, then lex asc
-        outputs.sort(key=lambda x: (-x[1], -x[2], x[0]))
-        final_list = [s for s, _, _ in outputs]
-
-        st.markdown("### Best Straight(s) per Box (per your tie rule)")
-        st.caption("Best straight only; if exactly one position has a 2-way tie at the top, both are kept.")
-        st.code("\n".join(final_list))
+    n_kept, kept_codes, final_list = generate(
+        sum_min, sum_max, low_max, min_low, max_low, min_high, max_high,
+        min_even, max_even, min_odd, max_odd, mand_bits, forbid_bits,
+        allow_quints, allow_quads, allow_triples, allow_dd, allow_runs4p, pos_probs)
+
+    st.success(f"Found {n_kept} box combos (out of {N_BOXES} total).")
+
+    if final_list is not None:
+        st.markdown("### Best Straight per Box")
+        st.caption("Best straight only; equal scores go to the lexicographically largest straight.")
+        payload = "\n".join(final_list)
+        st.code(payload)
 
         if final_list:
-            buf = io.StringIO(); buf.write("\n".join(final_list))
             st.download_button("Download final straights (.txt)",
-                               data=buf.getvalue(),
+                               data=payload,
                                file_name="final_straights.txt",
                                mime="text/plain")
 
-        if notes:
-            st.info("Tie reductions:\n" + "\n".join(notes))
-
     else:
         # No positional stats → show boxes (informational)
         st.markdown("### Boxes (no positional stats provided)")
         st.caption("Paste positional stats in the sidebar to score and order straights.")
-        box_list = ["".join(map(str, b)) for b in kept_boxes]
-        st.code("\n".join(box_list))
+        box_list = [STR5[c] for c in kept_codes.tolist()]
+        payload = "\n".join(box_list)
+        st.code(payload)
         if box_list:
-            buf = io.StringIO(); buf.write("\n".join(box_list))
-            st.download_button("Download boxes (.txt)", data=buf.getvalue(),
+            st.download_button("Download boxes (.txt)", data=payload,
                                file_name="boxes.txt", mime="text/plain")
 else:
     st.info("Set your constraints and click **Generate**.")